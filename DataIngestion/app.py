@@ -2,10 +2,33 @@
 import os
 import time
 import json
+import hashlib
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
 from classifier import combine_results, read_text_from_bytes, OPENAI_MODEL, USE_OPENAI
 
+@st.cache_resource
+def _http_session() -> requests.Session:
+    """One keep-alive session shared across reruns, so repeated classifications reuse the socket."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+    return session
+
+def _stream_read(upload, chunk: int = 65536):
+    upload.seek(0)
+    while True:
+        data = upload.read(chunk)
+        if not data:
+            break
+        yield data
+
+def _stream_sha256(upload) -> str:
+    h = hashlib.sha256()
+    for data in _stream_read(upload):
+        h.update(data)
+    return h.hexdigest()
+
 st.set_page_config(page_title="Desktop Ingestion + PII & Source Classification", page_icon="🔎", layout="wide")
 st.title("🔎 Simple Data Ingestion + Classification")
 st.caption("Upload a local file (txt/csv/json/pdf/docx) or paste text. Classifies origin (email/chat/local file) and detects PII. Uses OpenAI if available; falls back to heuristics.")
@@ -26,9 +49,20 @@ tab1, tab2 = st.tabs(["📁 Upload File", "📝 Paste Text"])
 with tab1:
     upload = st.file_uploader("Choose a file (.txt, .md, .csv, .json, .pdf, .docx)", type=["txt","md","csv","json","pdf","docx"])
     if upload:
-        raw = upload.read()
-        text = read_text_from_bytes(upload.name, raw)
-        st.success(f"Loaded `{upload.name}` ({len(text)} chars).")
+        # Decode/parse once per file content: widget reruns match on file_id without
+        # hashing, and re-uploading identical content matches on the streamed sha256.
+        cached = st.session_state.get("upload_text")
+        if cached and cached["file_id"] == upload.file_id:
+            digest, text = cached["sha256"], cached["text"]
+        else:
+            digest = _stream_sha256(upload)
+            if cached and (cached["sha256"], cached["name"]) == (digest, upload.name):
+                text = cached["text"]
+            else:
+                upload.seek(0)
+                text = read_text_from_bytes(upload.name, upload)
+            st.session_state["upload_text"] = {"file_id": upload.file_id, "name": upload.name, "sha256": digest, "text": text}
+        st.success(f"Loaded `{upload.name}` ({len(text)} chars, sha256 `{digest[:12]}`).")
         with st.expander("Preview (first 1,000 chars)"):
             st.code(text[:1000])
         if st.button("Classify Uploaded File"):
@@ -36,7 +70,7 @@ with tab1:
                 start = time.time()
                 if use_api:
                     try:
-                        resp = requests.post("http://127.0.0.1:8000/classify", json={"text": text, "had_file": True}, timeout=30)
+                        resp = _http_session().post("http://127.0.0.1:8000/classify", json={"text": text, "had_file": True}, timeout=(3, 30))
                         result = resp.json()
                     except Exception as e:
                         st.error(f"API call failed, falling back to local classify. Error: {e}")
@@ -58,7 +92,7 @@ with tab2:
                 start = time.time()
                 if use_api:
                     try:
-                        resp = requests.post("http://127.0.0.1:8000/classify", json={"text": pasted, "had_file": False}, timeout=30)
+                        resp = _http_session().post("http://127.0.0.1:8000/classify", json={"text": pasted, "had_file": False}, timeout=(3, 30))
                         result = resp.json()
                     except Exception as e:
                         st.error(f"API call failed, falling back to local classify. Error: {e}")
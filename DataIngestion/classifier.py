@@ -1,13 +1,45 @@
 
+import io
 import os
 import re
 import json
-from typing import Dict, Any, List
-from dataclasses import dataclass
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Union, BinaryIO
+from dataclasses import dataclass, field
 
 # ----------------- Optional OpenAI -----------------
 USE_OPENAI = bool(os.getenv("OPENAI_API_KEY"))
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+_llm_client = None
+_http_client = None
+_llm_client_lock = threading.Lock()
+
+def get_llm_client():
+    """Shared OpenAI client backed by a pooled HTTP/2 httpx client (created lazily, once)."""
+    global _llm_client, _http_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:  # another threadpool worker may have built it while we waited
+                import httpx
+                from openai import OpenAI
+                _http_client = httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=256, max_keepalive_connections=128),
+                    timeout=httpx.Timeout(60.0, connect=5.0),
+                )
+                _llm_client = OpenAI(http_client=_http_client)
+    return _llm_client
+
+def close_llm_client() -> None:
+    global _llm_client, _http_client
+    with _llm_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+        _llm_client = None
+        _http_client = None
 
 # ----------------- Simple PII Heuristics -----------------
 PAN_REGEX = re.compile(r"\b([A-Z]{5}[0-9]{4}[A-Z])\b")  # e.g., ABCDE1234F
@@ -17,9 +49,12 @@ PHONE_REGEX = re.compile(r"(?:(?:\+?91[\s\-]?)?[6-9]\d{9})|\b\d{3}[-\s.]?\d{3}[-
 CREDIT_CARD_REGEX = re.compile(r"\b(?:\d[ -]*?){13,19}\b")
 IP_REGEX = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b")
 DOB_REGEX = re.compile(r"\b(?:\d{1,2}[-/]){2}\d{2,4}\b")  # simplistic
+NON_DIGIT_REGEX = re.compile(r"\D")
+EMAIL_HEADER_REGEX = re.compile(r"(?im)^(from|to|subject|cc|bcc)\s*:")
+CHAT_MARKER_REGEX = re.compile(r"\b(you:|me:|agent:|bot:|whatsapp|slack|teams|chat)\b", re.I)
 
 def luhn_check(number: str) -> bool:
-    digits = [int(d) for d in re.sub(r"\D", "", number)]
+    digits = [int(d) for d in NON_DIGIT_REGEX.sub("", number)]
     if len(digits) < 13:
         return False
     checksum = 0
@@ -32,69 +67,179 @@ def luhn_check(number: str) -> bool:
         checksum += d
     return checksum % 10 == 0
 
+MAX_PII_MATCHES = 256  # per type; keeps responses bounded on large logs
+
+def _find_distinct(regex, text: str, keep=None, limit: int = MAX_PII_MATCHES) -> List[str]:
+    """Distinct matches in first-seen order, stopping the scan once `limit` are found."""
+    found: Dict[str, None] = {}
+    for m in regex.finditer(text):
+        value = m.group(m.lastindex or 0)
+        if value in found or (keep is not None and not keep(value)):
+            continue
+        found[value] = None
+        if len(found) >= limit:
+            break
+    return list(found)
+
 def pii_fallback(text: str) -> Dict[str, List[str]]:
-    candidates = {
-        "emails": EMAIL_REGEX.findall(text),
-        "phones": PHONE_REGEX.findall(text),
-        "pan": PAN_REGEX.findall(text),
-        "aadhaar": AADHAAR_REGEX.findall(text),
-        "ip": IP_REGEX.findall(text),
-        "dob_like": DOB_REGEX.findall(text),
-        "credit_cards_raw": CREDIT_CARD_REGEX.findall(text),
+    return {
+        "emails": _find_distinct(EMAIL_REGEX, text),
+        "phones": _find_distinct(PHONE_REGEX, text),
+        "pan": _find_distinct(PAN_REGEX, text),
+        "aadhaar": _find_distinct(AADHAAR_REGEX, text),
+        "ip": _find_distinct(IP_REGEX, text),
+        "dob_like": _find_distinct(DOB_REGEX, text),
+        "credit_cards": _find_distinct(CREDIT_CARD_REGEX, text, keep=luhn_check),
     }
-    cards_valid = []
-    for c in candidates["credit_cards_raw"]:
-        if luhn_check(c):
-            cards_valid.append(c)
-    candidates["credit_cards"] = cards_valid
-    candidates.pop("credit_cards_raw", None)
-    return candidates
+
+PII_TYPE_BY_KEY = {
+    "emails": "email",
+    "phones": "phone",
+    "pan": "pan",
+    "aadhaar": "aadhaar",
+    "ip": "ip",
+    "dob_like": "dob",
+    "credit_cards": "credit_card",
+}
 
 def source_heuristics(text: str, had_file: bool) -> str:
     if had_file:
         return "local_file"
-    if re.search(r"(?im)^(from|to|subject|cc|bcc)\s*:", text):
+    if EMAIL_HEADER_REGEX.search(text):
         return "email"
-    if re.search(r"\b(you:|me:|agent:|bot:|whatsapp|slack|teams|chat)\b", text, re.I):
+    if CHAT_MARKER_REGEX.search(text):
         return "chat"
     return "unknown"
 
-def classify_with_llm(text: str) -> Dict[str, Any]:
+_CLASSIFY_SYSTEM = {
+    "role": "system",
+    "content": (
+        "You are a precise data classifier. "
+        "Return strict JSON with keys: data_origin (email|chat|local_file|unknown), "
+        "pii_present (true|false), pii_types (array of strings among: email, phone, pan, aadhaar, ip, dob, credit_card, name, address), "
+        "summary (string <= 40 words). No extra commentary."
+    )
+}
+_PII_TYPES = ["email", "phone", "pan", "aadhaar", "ip", "dob", "credit_card", "name", "address"]
+CLASSIFY_SCHEMA = {
+    "name": "classification",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "data_origin": {"type": "string", "enum": ["email", "chat", "local_file", "unknown"]},
+            "pii_present": {"type": "boolean"},
+            "pii_types": {"type": "array", "items": {"type": "string", "enum": _PII_TYPES}},
+            "summary": {"type": "string"},
+        },
+        "required": ["data_origin", "pii_present", "pii_types", "summary"],
+        "additionalProperties": False,
+    },
+}
+_CLASSIFY_USER_PREFIX = "Classify the following text for data origin and PII:\n\n"
+_SEED_PREFIX = "Regex pre-scan flagged these PII types (confirm or reject them): "
+_MAX_LLM_CHARS = 8000
+
+@dataclass
+class CircuitBreaker:
+    """
+    Stops calling the LLM after `fail_max` consecutive failures. After `reset_timeout` seconds it goes
+    half-open and admits exactly one probe call; the probe's result closes or re-opens the circuit.
+    """
+    fail_max: int = 5
+    reset_timeout: float = 30.0
+    failures: int = 0
+    opened_at: float = 0.0
+    probe_started: float = 0.0  # 0 = no half-open probe in flight
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.failures < self.fail_max:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            # Half-open: one caller probes; a probe that never reports back frees the slot after reset_timeout
+            if self.probe_started and now - self.probe_started < self.reset_timeout:
+                return False
+            self.probe_started = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.probe_started = 0.0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.probe_started = 0.0
+            if self.failures >= self.fail_max:
+                self.opened_at = time.monotonic()
+
+LLM_BREAKER = CircuitBreaker()
+
+# Identical prompts (re-clicks, repeated API calls for the same file) skip the round-trip.
+LLM_CACHE_SIZE = 512
+_llm_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_llm_cache_lock = threading.Lock()
+
+def _llm_cache_key(content: str) -> str:
+    return hashlib.blake2b(f"{OPENAI_MODEL}\0{content}".encode("utf-8"), digest_size=16).hexdigest()
+
+def _llm_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    with _llm_cache_lock:
+        hit = _llm_cache.get(key)
+        if hit is not None:
+            _llm_cache.move_to_end(key)
+        return hit
+
+def _llm_cache_put(key: str, value: Dict[str, Any]) -> None:
+    with _llm_cache_lock:
+        _llm_cache[key] = value
+        _llm_cache.move_to_end(key)
+        while len(_llm_cache) > LLM_CACHE_SIZE:
+            _llm_cache.popitem(last=False)
+
+def classify_with_llm(text: str, seed_pii_types: Optional[List[str]] = None) -> Dict[str, Any]:
     if not USE_OPENAI:
         return {}
+    content = _CLASSIFY_USER_PREFIX + text[:_MAX_LLM_CHARS]
+    if seed_pii_types:
+        content = _SEED_PREFIX + ", ".join(seed_pii_types) + "\n\n" + content
+    key = _llm_cache_key(content)
+    cached = _llm_cache_get(key)
+    if cached is not None:
+        return cached
+    if not LLM_BREAKER.allow():
+        return {"_llm_error": "LLM circuit open after repeated failures; using heuristics."}
     try:
-        from openai import OpenAI
-        client = OpenAI()
-        system = {
-            "role": "system",
-            "content": (
-                "You are a precise data classifier. "
-                "Return strict JSON with keys: data_origin (email|chat|local_file|unknown), "
-                "pii_present (true|false), pii_types (array of strings among: email, phone, pan, aadhaar, ip, dob, credit_card, name, address), "
-                "summary (string <= 40 words). No extra commentary."
-            )
-        }
-        user = {
-            "role": "user",
-            "content": f"Classify the following text for data origin and PII:\n\n{text[:8000]}"
-        }
+        client = get_llm_client()
+        user = {"role": "user", "content": content}
         resp = client.chat.completions.create(
             model=OPENAI_MODEL,
-            messages=[system, user],
+            messages=[_CLASSIFY_SYSTEM, user],
             temperature=0.0,
-            response_format={"type": "json_object"},
+            response_format={"type": "json_schema", "json_schema": CLASSIFY_SCHEMA},
         )
         content = resp.choices[0].message.content
-        return json.loads(content)
+        parsed = json.loads(content)
     except Exception as e:
+        LLM_BREAKER.record_failure()
         return {"_llm_error": str(e)}
+    LLM_BREAKER.record_success()
+    _llm_cache_put(key, parsed)
+    return parsed
 
 def combine_results(text: str, had_file: bool) -> Dict[str, Any]:
     pii = pii_fallback(text)
     pii_present_fallback = any(len(v) > 0 for v in pii.values())
     source_guess = source_heuristics(text, had_file)
+    mapped_types = sorted({PII_TYPE_BY_KEY.get(k, k) for k, v in pii.items() if v})
 
-    llm = classify_with_llm(text)
+    # One LLM round-trip covers origin and PII; regex hits ride along as hints.
+    llm = classify_with_llm(text, seed_pii_types=mapped_types)
     result = {}
 
     if llm and "data_origin" in llm:
@@ -106,42 +251,38 @@ def combine_results(text: str, had_file: bool) -> Dict[str, Any]:
         if "_llm_error" in llm:
             result["_llm_error"] = llm["_llm_error"]
     else:
-        mapped_types = []
-        mapping = {
-            "emails": "email",
-            "phones": "phone",
-            "pan": "pan",
-            "aadhaar": "aadhaar",
-            "ip": "ip",
-            "dob_like": "dob",
-            "credit_cards": "credit_card",
-        }
-        for k, v in pii.items():
-            if v:
-                mapped_types.append(mapping.get(k, k))
         result.update({
             "data_origin": source_guess,
             "pii_present": pii_present_fallback,
-            "pii_types": sorted(set(mapped_types)),
+            "pii_types": mapped_types,
             "summary": "Heuristic classification (no LLM).",
             "_llm_used": False,
         })
+        if "_llm_error" in llm:
+            result["_llm_error"] = llm["_llm_error"]
     result["pii_matches"] = pii
     return result
 
 # -------------- File Readers (txt/csv/json/pdf/docx) --------------
-def read_text_from_bytes(name: str, data: bytes) -> str:
+def _as_stream(data: Union[bytes, BinaryIO]) -> BinaryIO:
+    return io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+
+def _as_bytes(data: Union[bytes, BinaryIO]) -> bytes:
+    return data if isinstance(data, (bytes, bytearray)) else data.read()
+
+def read_text_from_bytes(name: str, data: Union[bytes, BinaryIO]) -> str:
+    """`data` may be bytes or a binary file object; PDF/DOCX parsers read file objects in place."""
     name_lower = (name or "").lower()
     if name_lower.endswith((".txt", ".md", ".csv", ".json")):
+        raw = _as_bytes(data)
         try:
-            return data.decode("utf-8")
+            return raw.decode("utf-8")
         except UnicodeDecodeError:
-            return data.decode("latin-1", errors="ignore")
+            return raw.decode("latin-1", errors="ignore")
     elif name_lower.endswith(".pdf"):
         try:
             from PyPDF2 import PdfReader
-            import io
-            reader = PdfReader(io.BytesIO(data))
+            reader = PdfReader(_as_stream(data))
             parts = []
             for page in reader.pages:
                 parts.append(page.extract_text() or "")
@@ -150,24 +291,15 @@ def read_text_from_bytes(name: str, data: bytes) -> str:
             return f"[Error reading PDF: {e}]"
     elif name_lower.endswith(".docx"):
         try:
-            import tempfile
             from docx import Document
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-                tmp.write(data)
-                tmp.flush()
-                path = tmp.name
-            doc = Document(path)
-            text = "\\n".join(p.text for p in doc.paragraphs)
-            try:
-                os.unlink(path)
-            except Exception:
-                pass
-            return text
+            doc = Document(_as_stream(data))
+            return "\\n".join(p.text for p in doc.paragraphs)
         except Exception as e:
             return f"[Error reading DOCX: {e}]"
     else:
         # best-effort text decode
+        raw = _as_bytes(data)
         try:
-            return data.decode("utf-8")
+            return raw.decode("utf-8")
         except Exception:
-            return data.decode("latin-1", errors="ignore")
+            return raw.decode("latin-1", errors="ignore")
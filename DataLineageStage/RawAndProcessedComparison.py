@@ -2,108 +2,249 @@ import io
 import json
 import re
 import hashlib
+import functools
+import weakref
 from datetime import datetime
 from collections import Counter
-from typing import List, Dict, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional, FrozenSet
 
 import pandas as pd
 import numpy as np
 import streamlit as st
 import yaml
 
+try:
+    import hyperscan  # optional: multi-pattern SIMD regex scanning
+except ImportError:
+    hyperscan = None
+
+# Equality fingerprints only, no cryptographic need: xxh3 if installed, else blake2b
+try:
+    import xxhash
+    _fast_digest = xxhash.xxh3_128
+except ImportError:
+    _fast_digest = functools.partial(hashlib.blake2b, digest_size=16)
+
 # =============================
 # Helpers
 # =============================
 
-def _hash_series(s: pd.Series) -> str:
-    """Stable hash for a series (for lineage/consistency checks)."""
-    m = hashlib.sha256()
-    # Convert to bytes in a stable way
-    for v in s.fillna("__NaN__").astype(str).values:
-        m.update(v.encode("utf-8"))
-    return m.hexdigest()
-
+def _fast_df_fingerprint(df: pd.DataFrame) -> Tuple:
+    """Cache key for a DataFrame: shape, columns, dtypes and a fast digest of C-level row hashes."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    return (df.shape, tuple(map(str, df.columns)), tuple(df.dtypes.astype(str)), _fast_digest(row_hashes.tobytes()).hexdigest())
+
+# Reruns triggered by unrelated widgets (keys, retention, RBAC) reuse results for unchanged data
+_cache_df = st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _fast_df_fingerprint})
+
+def _memo_by_id(fn):
+    """Memoize on DataFrame identity for repeat calls within one script run.
+
+    Entries hold weak references to their DataFrame arguments: a hit requires the very same
+    frame objects, and an entry is dropped once its frame is freed (so a recycled id() never
+    returns another frame's result). st.cache_data handles reuse across runs.
+    """
+    cache = {}
+
+    def key_part(a):
+        return (id(a), a.shape) if isinstance(a, pd.DataFrame) else a
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (tuple(key_part(a) for a in args), tuple(sorted((k, key_part(v)) for k, v in kwargs.items())))
+        frames = [a for a in (*args, *kwargs.values()) if isinstance(a, pd.DataFrame)]
+        hit = cache.get(key)
+        if hit is not None and all(r() is f for r, f in zip(hit[0], frames)):
+            return hit[1]
+        refs = tuple(weakref.ref(f, lambda _, k=key: cache.pop(k, None)) for f in frames)
+        result = fn(*args, **kwargs)
+        cache[key] = (refs, result)
+        return result
+
+    wrapper.cache = cache
+    return wrapper
+
+_INT_RE = re.compile(r"-?\d+")
+_FLOAT_RE = re.compile(r"-?\d+(\.\d+)?")
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}")
+
+@_memo_by_id
+@_cache_df
 def _infer_types(df: pd.DataFrame) -> Dict[str, str]:
     """Crude type inference for display."""
     types = {}
     for c in df.columns:
-        col = df[c].dropna().astype(str)
-        sample = col.head(50)
-        if all(re.fullmatch(r"-?\d+", x) for x in sample):
+        dtype = df[c].dtype
+        # Already-typed columns need no regex pass
+        if pd.api.types.is_integer_dtype(dtype):
             types[c] = "integer"
-        elif all(re.fullmatch(r"-?\d+(\.\d+)?", x) for x in sample):
+            continue
+        if pd.api.types.is_float_dtype(dtype):
             types[c] = "float"
-        elif all(re.fullmatch(r"\d{4}-\d{2}-\d{2}", x) or re.fullmatch(r"\d{2}/\d{2}/\d{4}", x) for x in sample):
+            continue
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            types[c] = "date-like"
+            continue
+        sample = df[c].dropna().iloc[:50].astype(str)
+        if sample.str.fullmatch(_INT_RE).all():
+            types[c] = "integer"
+        elif sample.str.fullmatch(_FLOAT_RE).all():
+            types[c] = "float"
+        elif sample.str.fullmatch(_DATE_RE).all():
             types[c] = "date-like"
         else:
             types[c] = "string"
     return types
 
-def _tokenize(name: str) -> set:
-    return set(re.split(r"[_\W]+", name.lower())) - {""}
+_TOK_SPLIT = re.compile(r"[_\W]+")
 
-def _jaccard(a: set, b: set) -> float:
-    if not a and not b:
-        return 1.0
-    return len(a & b) / max(1, len(a | b))
+@functools.lru_cache(maxsize=4096)
+def _tokenize(name: str) -> FrozenSet[str]:
+    return frozenset(_TOK_SPLIT.split(name.lower())) - {""}
 
 def _value_kl(raw: pd.Series, proc: pd.Series, bins: int = 50) -> float:
     """Approx KL divergence for numeric-like columns (symmetrized)."""
     try:
-        r = pd.to_numeric(raw, errors="coerce").dropna()
-        p = pd.to_numeric(proc, errors="coerce").dropna()
+        # float32 halves the bytes the (memory-bound) histogram pass has to move
+        r = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=np.float32, na_value=np.nan)
+        p = pd.to_numeric(proc, errors="coerce").to_numpy(dtype=np.float32, na_value=np.nan)
+        r = r[~np.isnan(r)]
+        p = p[~np.isnan(p)]
         if len(r) < 5 or len(p) < 5:
             return np.nan
         hr, edges = np.histogram(r, bins=bins, density=True)
         hp, _ = np.histogram(p, bins=edges, density=True)
         # add epsilon to avoid zeros
         eps = 1e-12
-        hr = hr + eps
-        hp = hp + eps
-        kl_rp = np.sum(hr * np.log(hr / hp))
-        kl_pr = np.sum(hp * np.log(hp / hr))
-        return float(0.5 * (kl_rp + kl_pr))
+        hr += eps
+        hp += eps
+        # KL(r||p) + KL(p||r) == sum((hr - hp) * log(hr / hp)): one log pass instead of two
+        return float(0.5 * np.sum((hr - hp) * np.log(hr / hp)))
     except Exception:
         return np.nan
 
-def detect_pii_series(s: pd.Series) -> List[str]:
-    """Detect simple PII patterns present in series."""
-    detectors = {
-        "email": r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}",
-        "phone": r"(\+?\d[\d\-\s]{7,}\d)",
-        "credit_card": r"\b(?:\d[ -]*?){13,16}\b",
-        "ssn_like": r"\b\d{3}-\d{2}-\d{4}\b",
-    }
-    present = []
-    s_str = s.astype(str).fillna("")
-    for label, pat in detectors.items():
-        if s_str.str.contains(pat, regex=True).any():
-            present.append(label)
-    return present
-
-def pii_report(df: pd.DataFrame) -> Dict[str, List[str]]:
+_PII_PATTERNS = {
+    "email": re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}"),
+    "phone": re.compile(r"\+?\d[\d\-\s]{7,}\d"),
+    "credit_card": re.compile(r"\b(?:\d[ -]*?){13,16}\b"),
+    "ssn_like": re.compile(r"\b\d{3}-\d{2}-\d{4}\b"),
+}
+# NUL never matches any PII pattern, so joined cells cannot bleed into each other.
+_CELL_SEP = "\x00"
+
+_PII_LABELS = list(_PII_PATTERNS)
+_NON_DIGIT = re.compile(r"\D")
+
+def _luhn_ok(num: str) -> bool:
+    digits = [int(d) for d in _NON_DIGIT.sub("", num)]
+    checksum = sum(d if i % 2 == 0 else (d * 2 - 9 * (d * 2 > 9)) for i, d in enumerate(reversed(digits)))
+    return checksum % 10 == 0
+
+def _pii_present(label: str, blob: str) -> bool:
+    """Confirm a label on the joined column; card-like digit runs must also pass the Luhn check."""
+    pat = _PII_PATTERNS[label]
+    if label == "credit_card":
+        return any(_luhn_ok(m.group()) for m in pat.finditer(blob))
+    return pat.search(blob) is not None
+
+def _compile_pii_hyperscan():
+    """All PII patterns in one Hyperscan database (single SIMD pass); None if hyperscan is unavailable."""
+    if hyperscan is None:
+        return None
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[p.pattern.encode() for p in _PII_PATTERNS.values()],
+            ids=list(range(len(_PII_LABELS))),
+            elements=len(_PII_LABELS),
+            flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(_PII_LABELS),
+        )
+        return db
+    except Exception:
+        return None
+
+_PII_HS_DB = _compile_pii_hyperscan()
+
+PII_SAMPLE_ROWS = 5000
+_DIGIT_PII_LABELS = ["phone", "credit_card"]
+
+def _pii_labels_for(dtype) -> List[str]:
+    """Labels a column of this pandas dtype can possibly hold.
+
+    Decided from the dtype alone (a fact about every value), never from sampled values:
+    numeric columns can only hold digit-only PII (phone, card), bool and datetime/timedelta
+    columns (incl. Arrow date/timestamp) none, and object/string/other columns get every label.
+    """
+    kind = getattr(dtype, "kind", "O")
+    if kind in "iuf":
+        return _DIGIT_PII_LABELS
+    if kind in "bMm":
+        return []
+    return _PII_LABELS
+
+def detect_pii_series(s: pd.Series, sample: Optional[int] = PII_SAMPLE_ROWS, labels: Optional[List[str]] = None) -> List[str]:
+    """Detect simple PII patterns present in series.
+
+    Columns with more than `sample` non-null values are checked on a fixed random
+    sample of that size (presence only); pass sample=None for an exhaustive scan.
+    `labels` restricts the check to a subset of PII types (default: all).
+    """
+    labels = _PII_LABELS if labels is None else labels
+    if not labels:
+        return []
+    ss = s.dropna()
+    if sample is not None and len(ss) > sample:
+        ss = ss.sample(n=sample, random_state=0)
+    blob = _CELL_SEP.join(ss.astype(str).tolist())
+    if _PII_HS_DB is None:
+        return [label for label in labels if _pii_present(label, blob)]
+    wanted = {_PII_LABELS.index(label) for label in labels}
+    matched = set()
+
+    def on_match(pattern_id, start, end, flags, context):
+        if pattern_id in wanted:
+            matched.add(pattern_id)
+        return len(matched) == len(wanted)  # stop once every wanted label has fired
+
+    try:
+        _PII_HS_DB.scan(blob.encode("utf-8"), match_event_handler=on_match)
+    except hyperscan.ScanTerminated:
+        pass
+    # Hyperscan only proves the regex fired; card candidates still need the Luhn check
+    return [
+        label for i, label in enumerate(_PII_LABELS)
+        if i in matched and (label != "credit_card" or _pii_present(label, blob))
+    ]
+
+@_memo_by_id
+@_cache_df
+def pii_report(df: pd.DataFrame, sample: Optional[int] = PII_SAMPLE_ROWS) -> Dict[str, List[str]]:
     out = {}
     for c in df.columns:
-        found = detect_pii_series(df[c])
+        found = detect_pii_series(df[c], sample=sample, labels=_pii_labels_for(df[c].dtype))
         if found:
             out[c] = found
     return out
 
+@_memo_by_id
+@_cache_df
 def compare_schemas(raw: pd.DataFrame, proc: pd.DataFrame) -> pd.DataFrame:
     raw_types = _infer_types(raw)
     proc_types = _infer_types(proc)
-    cols = sorted(set(raw.columns) | set(proc.columns))
-    rows = []
-    for c in cols:
-        rows.append({
-            "column": c,
-            "in_raw": c in raw.columns,
-            "in_processed": c in proc.columns,
-            "raw_type": raw_types.get(c, None),
-            "processed_type": proc_types.get(c, None),
-            "name_similarity": _jaccard(_tokenize(c if c in raw.columns else ""), _tokenize(c if c in proc.columns else "")),
-        })
-    return pd.DataFrame(rows)
+    cols = pd.Index(sorted(set(raw.columns) | set(proc.columns)))
+    in_raw = cols.isin(raw.columns)
+    in_proc = cols.isin(proc.columns)
+    # Jaccard of a name with itself is 1.0; against a missing side ("") it is 0.0 unless the name has no tokens
+    no_tokens = np.fromiter((not _tokenize(c) for c in cols), dtype=bool, count=len(cols))
+    return pd.DataFrame({
+        "column": cols,
+        "in_raw": in_raw,
+        "in_processed": in_proc,
+        "raw_type": cols.map(raw_types.get),
+        "processed_type": cols.map(proc_types.get),
+        "name_similarity": np.where((in_raw & in_proc) | no_tokens, 1.0, 0.0),
+    })
 
 def key_check(raw: pd.DataFrame, proc: pd.DataFrame, keys: List[str]) -> Dict[str, int]:
     def dup_count(df, keys):
@@ -115,29 +256,43 @@ def key_check(raw: pd.DataFrame, proc: pd.DataFrame, keys: List[str]) -> Dict[st
         "processed_rows": int(len(proc)),
     }
 
+def _columns_equal(a: pd.Series, b: pd.Series) -> bool:
+    """Vectorized element-wise equality with missing == missing; incomparable dtypes count as different."""
+    try:
+        same = a.eq(b) | (a.isna() & b.isna())
+        return bool(same.fillna(False).all())
+    except Exception:
+        return False
+
 def preservation_checks(raw: pd.DataFrame, proc: pd.DataFrame, keys: List[str]) -> Dict[str, Optional[str]]:
     out = {}
     if not keys:
         return out
     # join on keys to compare row-level preservation for a couple of columns
-    common_cols = [c for c in raw.columns if c in proc.columns]
-    if not common_cols:
+    value_cols = [c for c in raw.columns if c in proc.columns and c not in keys]
+    if not value_cols:
         return out
-    merged = raw[keys + common_cols].merge(proc[keys + common_cols], on=keys, how="left", suffixes=("_raw", "_proc"))
+    merged = raw[keys + value_cols].merge(proc[keys + value_cols], on=keys, how="left", suffixes=("_raw", "_proc"))
     # pick a few comparable columns
-    comparable = [c for c in common_cols if c not in keys][:5]
-    for c in comparable:
-        hr = _hash_series(merged[f"{c}_raw"])
-        hp = _hash_series(merged[f"{c}_proc"])
-        out[f"column_hash_match::{c}"] = "match" if hr == hp else "DIFF"
+    for c in value_cols[:5]:
+        out[f"column_match::{c}"] = "match" if _columns_equal(merged[f"{c}_raw"], merged[f"{c}_proc"]) else "DIFF"
     return out
 
+def _numeric_like(s: pd.Series, probe: int = 100) -> bool:
+    """Numeric dtype, or mostly numeric text in the first `probe` rows."""
+    if pd.api.types.is_numeric_dtype(s):
+        return True
+    return bool(pd.to_numeric(s.iloc[:probe], errors="coerce").notna().mean() > 0.5)
+
+@_cache_df
 def distribution_checks(raw: pd.DataFrame, proc: pd.DataFrame) -> pd.DataFrame:
     common = [c for c in raw.columns if c in proc.columns]
-    rows = []
-    for c in common:
-        kl = _value_kl(raw[c], proc[c])
-        rows.append({"column": c, "kl_divergence_sym": kl})
+    # Text columns get NaN without a full to_numeric pass
+    numeric = [c for c in common if _numeric_like(raw[c]) and _numeric_like(proc[c])]
+    # numpy releases the GIL in the histogram pass, so threads overlap across columns
+    with ThreadPoolExecutor() as pool:
+        kls = dict(zip(numeric, pool.map(lambda c: _value_kl(raw[c], proc[c]), numeric)))
+    rows = [{"column": c, "kl_divergence_sym": kls.get(c, np.nan)} for c in common]
     return pd.DataFrame(rows)
 
 def build_lineage_notes(raw_name: str, proc_name: str, keys: List[str], schema_df: pd.DataFrame, pii_raw: Dict[str, List[str]], pii_proc: Dict[str, List[str]]) -> str:
@@ -154,7 +309,10 @@ def build_lineage_notes(raw_name: str, proc_name: str, keys: List[str], schema_d
     if dropped:
         points.append(f"- **Columns dropped in processed**: {dropped}.")
     if not type_changed.empty:
-        changes = "; ".join(f"{r.column}: {r.raw_type} → {r.processed_type}" for r in type_changed.itertuples(index=False))
+        changes = "; ".join((
+            type_changed["column"].astype(str) + ": " + type_changed["raw_type"].astype(str)
+            + " → " + type_changed["processed_type"].astype(str)
+        ).tolist())
         points.append(f"- **Type changes**: {changes}.")
 
     # PII movement notes
@@ -172,6 +330,24 @@ def build_lineage_notes(raw_name: str, proc_name: str, keys: List[str], schema_d
     md = "# Lineage Notes\n" + "\n".join(points)
     return md
 
+def read_uploaded_csv(uploaded) -> pd.DataFrame:
+    """Parse with the multithreaded Arrow reader into Arrow-backed dtypes; fall back for older pandas/no pyarrow."""
+    try:
+        return pd.read_csv(uploaded, engine="pyarrow", dtype_backend="pyarrow")
+    except (ImportError, TypeError, ValueError):
+        uploaded.seek(0)
+        return pd.read_csv(uploaded)
+
+def load_uploaded_csv(uploaded, slot: str) -> pd.DataFrame:
+    """Parse an upload once per content; reruns reuse the DataFrame kept in session_state for this slot."""
+    data = uploaded.getvalue()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()  # non-cryptographic fingerprint
+    cached = st.session_state.get(f"csv::{slot}")
+    if cached is None or cached[0] != digest:
+        cached = (digest, read_uploaded_csv(io.BytesIO(data)))
+        st.session_state[f"csv::{slot}"] = cached
+    return cached[1]
+
 def build_policy_yaml(dataset: str, pii_cols: Dict[str, List[str]], retention_hot_days: int, retention_cold_days: int, rbac_roles: List[str]) -> str:
     policy = {
         "dataset": dataset,
@@ -186,7 +362,8 @@ def build_policy_yaml(dataset: str, pii_cols: Dict[str, List[str]], retention_ho
             "rbac": [{"role": r, "access": "read"} for r in rbac_roles]
         }
     }
-    return yaml.safe_dump(policy, sort_keys=False)
+    # libyaml's C emitter when PyYAML was built with it; same output as safe_dump
+    return yaml.dump(policy, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper), sort_keys=False)
 
 # =============================
 # UI
@@ -215,14 +392,14 @@ with left:
     st.subheader("Upload RAW dataset (CSV)")
     raw_file = st.file_uploader("raw.csv", type=["csv"], key="raw")
     if raw_file is not None:
-        raw_df = pd.read_csv(raw_file)
+        raw_df = load_uploaded_csv(raw_file, "raw")
         st.dataframe(raw_df.head(20))
 
 with right:
     st.subheader("Upload PROCESSED dataset (CSV)")
     proc_file = st.file_uploader("processed.csv", type=["csv"], key="proc")
     if proc_file is not None:
-        proc_df = pd.read_csv(proc_file)
+        proc_df = load_uploaded_csv(proc_file, "proc")
         st.dataframe(proc_df.head(20))
 
 st.divider()
@@ -257,6 +434,8 @@ if 'raw_df' in locals() and 'proc_df' in locals():
     st.dataframe(drift_df)
 
     st.markdown("### 4) PII Detection")
+    st.caption(f"Columns with more than {PII_SAMPLE_ROWS:,} values are scanned on a random sample of {PII_SAMPLE_ROWS:,} rows. "
+               "A PII type present in under ~0.1% of rows can be missed; smaller tables are scanned exhaustively.")
     pii_raw = pii_report(raw_df)
     pii_proc = pii_report(proc_df)
     c1, c2 = st.columns(2)
@@ -267,7 +446,7 @@ if 'raw_df' in locals() and 'proc_df' in locals():
         st.markdown("**PII in PROCESSED**")
         st.json(pii_proc or {"PII": "none"})
 
-    st.markdown("### 5) Column Preservation Hash Spot-Checks")
+    st.markdown("### 5) Column Preservation Spot-Checks")
     pres = preservation_checks(raw_df, proc_df, keys) if keys else {}
     if pres:
         st.json(pres)
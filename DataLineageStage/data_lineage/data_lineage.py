@@ -1,3 +1,6 @@
+import hashlib
+import io
+
 import streamlit as st
 import pandas as pd
 import openai  # You would need to install openai: pip install openai
@@ -61,6 +64,17 @@ def get_llm_lineage_analysis(api_key, table_schema, selected_attributes, sample_
     return mock_response
 
 
+# Same reader as DataLineageStage/RawAndProcessedComparison.py; each app is launched on its own
+# with `streamlit run`, so the helper is duplicated rather than imported across directories.
+def read_uploaded_csv(uploaded):
+    """Parse with the multithreaded Arrow reader; fall back for older pandas/no pyarrow."""
+    try:
+        return pd.read_csv(uploaded, engine="pyarrow", dtype_backend="pyarrow")
+    except (ImportError, TypeError, ValueError):
+        uploaded.seek(0)
+        return pd.read_csv(uploaded)
+
+
 # --- Streamlit UI ---
 st.set_page_config(layout="wide")
 st.title("Interactive Data Lineage with LLM")
@@ -74,11 +88,16 @@ if 'df' not in st.session_state:
 uploaded_file = st.file_uploader("Upload your data file", type=["csv"])
 
 if uploaded_file is not None:
-    try:
-        df = pd.read_csv(uploaded_file)
-        st.session_state.df = df
-    except Exception as e:
-        st.error(f"Error loading CSV file: {e}")
+    # Re-parse only when the uploaded bytes change, not on every widget rerun
+    data = uploaded_file.getvalue()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    if st.session_state.get("df_digest") != digest:
+        try:
+            df = read_uploaded_csv(io.BytesIO(data))
+            st.session_state.df = df
+            st.session_state.df_digest = digest
+        except Exception as e:
+            st.error(f"Error loading CSV file: {e}")
 
 if st.session_state.df is not None:
     df = st.session_state.df
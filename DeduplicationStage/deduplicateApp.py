@@ -11,29 +11,54 @@ Usage:
   python dedupe_llm.py --in data.csv --out dedup.csv --text-col text --threshold 0.92
 
 Dependencies:
-  pip install openai pandas numpy scikit-learn tqdm
+  pip install openai pandas numpy tqdm
+  (optional) pip install datasketch   # for --lsh
+  (optional) pip install faiss-cpu    # faster neighbor search
+  (optional) pip install numba        # JIT union-find
 Requires:
   export OPENAI_API_KEY=sk-...
 """
 
 import os
 import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import sqlite3
 import argparse
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
-from typing import List, Dict, Tuple, Any, Optional
-
-# For nearest neighbor search
-from sklearn.neighbors import NearestNeighbors
+from collections import deque
+from typing import List, Dict, Tuple, Any, Optional, Callable
 
 # OpenAI SDK v1.x
 try:
-    from openai import OpenAI
+    from openai import OpenAI, AsyncOpenAI, RateLimitError
 except Exception as e:
     print("Please install openai>=1.0.0: pip install openai", file=sys.stderr)
     raise
 
+# Optional: MinHash/LSH candidate pre-filter (--lsh)
+try:
+    from datasketch import MinHash, MinHashLSH
+except ImportError:
+    MinHash = MinHashLSH = None
+
+# Optional: Faiss neighbor search (falls back to a numpy GEMM)
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# Optional: Numba JIT for the union-find pass
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 # ---------------------------
 # Utils
 # ---------------------------
@@ -68,6 +93,47 @@ class DSU:
             self.parent[rb] = ra
             self.rank[ra] += 1
 
+def _dsu_labels_py(n: int, edges_i: np.ndarray, edges_j: np.ndarray) -> np.ndarray:
+    dsu = DSU(n)
+    for i, j in zip(edges_i.tolist(), edges_j.tolist()):
+        dsu.union(i, j)
+    return np.array([dsu.find(i) for i in range(n)], dtype=np.int64)
+
+if njit is not None:
+    @njit(cache=True)
+    def _dsu_labels(n, edges_i, edges_j):
+        """Same algorithm as DSU (path halving, union by rank) over flat arrays; returns each item's root."""
+        parent = np.arange(n)
+        rank = np.zeros(n, dtype=np.int32)
+        for k in range(edges_i.shape[0]):
+            a = edges_i[k]
+            while parent[a] != a:
+                parent[a] = parent[parent[a]]
+                a = parent[a]
+            b = edges_j[k]
+            while parent[b] != b:
+                parent[b] = parent[parent[b]]
+                b = parent[b]
+            if a == b:
+                continue
+            if rank[a] < rank[b]:
+                parent[a] = b
+            elif rank[b] < rank[a]:
+                parent[b] = a
+            else:
+                parent[b] = a
+                rank[a] += 1
+        labels = np.empty(n, dtype=np.int64)
+        for i in range(n):
+            r = i
+            while parent[r] != r:
+                parent[r] = parent[parent[r]]
+                r = parent[r]
+            labels[i] = r
+        return labels
+else:
+    _dsu_labels = _dsu_labels_py
+
 def batched(lst: List[Any], n: int):
     for i in range(0, len(lst), n):
         yield lst[i:i+n]
@@ -76,76 +142,377 @@ def batched(lst: List[Any], n: int):
 # Embedding
 # ---------------------------
 
-def embed_texts(texts: List[str], model: str = "text-embedding-3-small", batch_size: int = 100) -> np.ndarray:
-    """Return (N, D) embedding matrix for the given texts using OpenAI embeddings."""
+class EmbeddingCache:
+    """On-disk SQLite cache of embeddings keyed by sha256(model|text), so re-runs only embed new texts."""
+    _SQL_VARS = 900  # stay under SQLite's bound-parameter limit
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, dim INT, vec BLOB)")
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}|{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        for chunk in batched(keys, self._SQL_VARS):
+            q = f"SELECT key, vec FROM cache WHERE key IN ({','.join('?' * len(chunk))})"
+            for k, vec in self.conn.execute(q, chunk):
+                found[k] = np.frombuffer(vec, dtype=np.float32)
+        return found
+
+    def put_many(self, keys: List[str], vecs: np.ndarray):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO cache (key, dim, vec) VALUES (?, ?, ?)",
+            ((k, int(v.shape[0]), v.astype(np.float32).tobytes()) for k, v in zip(keys, vecs)),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def _alloc_ram(n: int, dim: int) -> np.ndarray:
+    return np.empty((n, dim), dtype=np.float32)
+
+def _l2_normalize_rows(arr: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length in place (zero rows stay zero)."""
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    arr /= norms
+    return arr
+
+def _texts_hash(model: str, texts: List[str]) -> str:
+    return hashlib.sha256("\x00".join([model] + texts).encode("utf-8")).hexdigest()
+
+async def _embed_openai_async(texts: List[str], model: str, batch_size: int, concurrency: int,
+                              max_tokens_per_minute: int, alloc: Callable[[int, int], np.ndarray]) -> np.ndarray:
+    client = AsyncOpenAI()
+    sem = asyncio.Semaphore(max(1, concurrency))
+    batches = list(batched(texts, batch_size))
+    out: Optional[np.ndarray] = None  # allocated once the first response tells us the dimension
+    token_log: deque = deque()  # (timestamp, tokens) of requests in the last minute
+    pbar = tqdm(total=len(batches), desc="Embedding", unit="batch")
+
+    async def throttle():
+        while max_tokens_per_minute:
+            now = time.monotonic()
+            while token_log and now - token_log[0][0] > 60:
+                token_log.popleft()
+            if sum(t for _, t in token_log) < max_tokens_per_minute:
+                return
+            await asyncio.sleep(60 - (now - token_log[0][0]))
+
+    async def one(i: int, batch: List[str]):
+        async with sem:
+            for attempt in range(6):
+                await throttle()
+                try:
+                    resp = await client.embeddings.create(model=model, input=batch)
+                    break
+                except RateLimitError:
+                    if attempt == 5:
+                        raise
+                    await asyncio.sleep(min(60.0, 2 ** attempt) + random.random())  # exponential backoff + jitter
+            token_log.append((time.monotonic(), resp.usage.total_tokens if resp.usage else 0))
+            # Each resp.data[i].embedding is a list[float]; normalize the batch in one op, then
+            # drop it straight into the output matrix
+            arr = _l2_normalize_rows(np.asarray([d.embedding for d in resp.data], dtype=np.float32))
+            nonlocal out
+            if out is None:
+                out = alloc(len(texts), arr.shape[1])
+            out[i * batch_size:i * batch_size + len(batch)] = arr
+            pbar.update(1)
+
+    try:
+        await asyncio.gather(*(one(i, b) for i, b in enumerate(batches)))
+    finally:
+        pbar.close()
+        await client.close()
+    return out if out is not None else _alloc_ram(0, 0)
+
+def _embed_openai(texts: List[str], model: str, batch_size: int, concurrency: int = 8,
+                  max_tokens_per_minute: int = 0, alloc: Callable[[int, int], np.ndarray] = _alloc_ram) -> np.ndarray:
+    """Embed with up to `concurrency` requests in flight (optionally capped at a tokens-per-minute budget)."""
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY not set")
+    return asyncio.run(_embed_openai_async(texts, model, batch_size, concurrency, max_tokens_per_minute, alloc))
+
+BATCH_DONE = {"completed", "failed", "expired", "cancelled"}
+BATCH_MAX_INPUTS = 50_000  # Batch API limit on embedding inputs per batch
 
+def _save_batch_state(path: str, state: Dict[str, Any]):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def _embed_openai_batch(texts: List[str], model: str, work_dir: str, poll_seconds: float = 30.0,
+                        alloc: Callable[[int, int], np.ndarray] = _alloc_ram) -> np.ndarray:
+    """
+    Embed via the OpenAI Batch API (half price, results within 24h, no interactive RPM/TPM limits).
+    Inputs are split into batches of at most BATCH_MAX_INPUTS. Submitted batch ids are kept in
+    `work_dir/batch_state.json`, so re-running the same input after a crash resumes polling instead
+    of paying again; a batch that fails/expires is dropped from the state and resubmitted next run.
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY not set")
     client = OpenAI()
-    vecs = []
-    for batch in tqdm(list(batched(texts, batch_size)), desc="Embedding", unit="batch"):
-        resp = client.embeddings.create(model=model, input=batch)
-        # Each resp.data[i].embedding is a list[float]
-        vecs.extend([d.embedding for d in resp.data])
-    return np.array(vecs, dtype=np.float32)
+    os.makedirs(work_dir, exist_ok=True)
+    state_path = os.path.join(work_dir, "batch_state.json")
+    input_hash = _texts_hash(model, texts)
+
+    state: Dict[str, Any] = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    if state.get("input_hash") != input_hash:
+        state = {"input_hash": input_hash, "batches": {}}
+
+    # Submit any part not already in flight (part k covers texts[k*MAX : (k+1)*MAX])
+    for k, start in enumerate(range(0, len(texts), BATCH_MAX_INPUTS)):
+        if str(k) in state["batches"]:
+            continue
+        req_path = os.path.join(work_dir, f"requests_{k}.jsonl")
+        with open(req_path, "w", encoding="utf-8") as f:
+            for i, t in enumerate(texts[start:start + BATCH_MAX_INPUTS], start=start):
+                f.write(json.dumps({"custom_id": f"c{i}", "method": "POST", "url": "/v1/embeddings",
+                                    "body": {"model": model, "input": t}}) + "\n")
+        with open(req_path, "rb") as f:
+            upload = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(input_file_id=upload.id, endpoint="/v1/embeddings", completion_window="24h")
+        state["batches"][str(k)] = batch.id
+        _save_batch_state(state_path, state)
+        print(f"Submitted embedding batch {batch.id} (part {k}, {min(BATCH_MAX_INPUTS, len(texts) - start)} requests)")
+
+    while True:
+        batches = {k: client.batches.retrieve(bid) for k, bid in state["batches"].items()}
+        dead = {k: b for k, b in batches.items()
+                if b.status in BATCH_DONE and (b.status != "completed" or not b.output_file_id)}
+        if dead:
+            for k in dead:
+                del state["batches"][k]
+            _save_batch_state(state_path, state)
+            desc = ", ".join(f"{b.id}: {b.status}" for b in dead.values())
+            raise RuntimeError(f"Embedding batch(es) did not complete ({desc}); re-run to resubmit them")
+        if all(b.status == "completed" for b in batches.values()):
+            break
+        for b in batches.values():
+            if b.status != "completed":
+                print(f"Batch {b.id}: {b.status} ({b.request_counts.completed}/{b.request_counts.total})")
+        time.sleep(poll_seconds)
+
+    out: Optional[np.ndarray] = None
+    filled = np.zeros(len(texts), dtype=bool)
+    errors: Dict[str, str] = {}  # part -> first failed request in it
+    for k, b in batches.items():
+        # Stream the output file line by line; at 50k inputs per batch it is far too large to hold as one string
+        with client.files.with_streaming_response.content(b.output_file_id) as resp:
+            for line in resp.iter_lines():
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                body = (rec.get("response") or {}).get("body") or {}
+                if rec.get("error") or "data" not in body:
+                    errors.setdefault(k, f"{rec.get('custom_id')}: {rec.get('error') or body}")
+                    continue
+                vec = body["data"][0]["embedding"]
+                if out is None:
+                    out = alloc(len(texts), len(vec))
+                row = int(rec["custom_id"][1:])
+                out[row] = vec
+                filled[row] = True
+    missing = np.flatnonzero(~filled)
+    for row in missing:
+        errors.setdefault(str(int(row) // BATCH_MAX_INPUTS), f"c{row}: no output row")
+    if errors:
+        # Forget the broken parts so the next run resubmits them instead of re-downloading the same output
+        for k in errors:
+            del state["batches"][k]
+        _save_batch_state(state_path, state)
+        desc = "; ".join(f"part {k} ({e})" for k, e in errors.items())
+        raise RuntimeError(f"Embedding batch output incomplete: {desc}; re-run to resubmit those parts")
+    return _l2_normalize_rows(out) if out is not None else _alloc_ram(0, 0)
+
+def embed_texts(texts: List[str], model: str = "text-embedding-3-small", batch_size: int = 100,
+                cache: Optional[EmbeddingCache] = None, concurrency: int = 8,
+                max_tokens_per_minute: int = 0, backend: str = "openai",
+                batch_dir: str = ".dedupe_batch", mmap_path: Optional[str] = None) -> np.ndarray:
+    """
+    Return (N, D) embedding matrix for the given texts using OpenAI embeddings.
+    With `mmap_path`, the matrix is written to a memory-mapped .npy file instead of RAM; a `.json`
+    sidecar records model/shape/input hash so a later run on the same input just maps the file.
+    """
+    alloc = _alloc_ram
+    if mmap_path:
+        meta_path = mmap_path + ".json"
+        input_hash = _texts_hash(model, texts)
+        if os.path.exists(mmap_path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("input_hash") == input_hash:
+                print(f"Reusing embeddings from {mmap_path} ({meta['rows']} x {meta['dim']})")
+                return np.load(mmap_path, mmap_mode="r")
+            os.remove(meta_path)  # stale; only rewritten once the new matrix is complete
+        alloc = lambda n, dim: np.lib.format.open_memmap(mmap_path, mode="w+", dtype=np.float32, shape=(n, dim))
+
+    def _embed(xs: List[str], alloc_fn: Callable[[int, int], np.ndarray]) -> np.ndarray:
+        if backend == "openai-batch":
+            return _embed_openai_batch(xs, model, batch_dir, alloc=alloc_fn)
+        return _embed_openai(xs, model, batch_size, concurrency, max_tokens_per_minute, alloc=alloc_fn)
+
+    if cache is None:
+        out = _embed(texts, alloc)
+    else:
+        keys = [EmbeddingCache.key(model, t) for t in texts]
+        hits = cache.get_many(keys)
+        miss_idx = [i for i, k in enumerate(keys) if k not in hits]
+        hit_idx = [i for i, k in enumerate(keys) if k in hits]
+        print(f"Embedding cache: {len(hit_idx)} hits, {len(miss_idx)} misses")
+        fresh = None
+        if miss_idx:
+            fresh = _embed([texts[i] for i in miss_idx], _alloc_ram)
+            cache.put_many([keys[i] for i in miss_idx], fresh)
+        dim = fresh.shape[1] if fresh is not None else len(hits[keys[0]])
+        out = alloc(len(texts), dim)
+        if fresh is not None:
+            out[miss_idx] = fresh
+        if hit_idx:
+            out[hit_idx] = np.stack([hits[keys[i]] for i in hit_idx])
+
+    if isinstance(out, np.memmap):
+        out.flush()
+        with open(meta_path, "w") as f:
+            json.dump({"model": model, "rows": int(out.shape[0]), "dim": int(out.shape[1]), "input_hash": input_hash}, f)
+    return out
 
 # ---------------------------
 # Dedup logic
 # ---------------------------
 
-def build_clusters(embeddings: np.ndarray, threshold: float) -> Dict[int, List[int]]:
+def lsh_candidate_pairs(texts: List[str], lsh_threshold: float = 0.3, num_perm: int = 128,
+                        shingle: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Candidate pairs (i < j) whose word-shingle Jaccard is likely >= lsh_threshold.
+    Only these pairs are scored by build_clusters, so mostly-unique corpora skip the N x N pass.
+    """
+    if MinHashLSH is None:
+        raise RuntimeError("--lsh needs datasketch: pip install datasketch")
+    lsh = MinHashLSH(threshold=lsh_threshold, num_perm=num_perm)
+    sigs = []
+    for i, t in enumerate(texts):
+        words = t.split()
+        grams = {" ".join(words[k:k + shingle]) for k in range(max(1, len(words) - shingle + 1))}
+        m = MinHash(num_perm=num_perm)
+        m.update_batch([g.encode("utf-8") for g in grams])
+        lsh.insert(i, m)
+        sigs.append(m)
+    pairs = [(i, j) for i, m in enumerate(sigs) for j in lsh.query(m) if j > i]
+    if not pairs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    ii, jj = np.array(pairs, dtype=np.int64).T
+    return ii, jj
+
+FAISS_HNSW_MIN_ROWS = 100_000  # above this, switch from exact range search to HNSW top-k
+FAISS_HNSW_K = 50
+
+def _faiss_edges(E: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Pairs (i < j) with inner product >= threshold, found with a Faiss index over unit vectors."""
+    n, dim = E.shape
+    E = np.ascontiguousarray(E, dtype=np.float32)
+    if n < FAISS_HNSW_MIN_ROWS:
+        index = faiss.IndexFlatIP(dim)
+        index.add(E)
+        # range_search keeps scores strictly above the radius; nudge it down and re-filter
+        lims, D, I = index.range_search(E, float(np.nextafter(np.float32(threshold), np.float32(-np.inf))))
+        rows = np.repeat(np.arange(n), np.diff(lims))
+    else:
+        index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = 64
+        index.add(E)
+        D, I = index.search(E, FAISS_HNSW_K)
+        rows = np.repeat(np.arange(n), I.shape[1])
+        D, I = D.ravel(), I.ravel()
+    keep = (D >= threshold) & (I > rows)
+    return rows[keep], I[keep].astype(np.int64)
+
+def _blocked_edges(E: np.ndarray, threshold: float, block_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs (i < j) with E[i] . E[j] >= threshold, scored in block_size x block_size tiles of the upper
+    triangle, so peak memory is one tile instead of N x N.
+    """
+    n = E.shape[0]
+    out_i, out_j = [], []
+    for i0 in range(0, n, block_size):
+        A = E[i0:i0 + block_size]
+        for j0 in range(i0, n, block_size):
+            hit = A @ E[j0:j0 + block_size].T >= threshold
+            if j0 == i0:
+                hit = np.triu(hit, k=1)
+            bi, bj = np.nonzero(hit)
+            out_i.append(bi + i0)
+            out_j.append(bj + j0)
+    if not out_i:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(out_i), np.concatenate(out_j)
+
+def build_clusters(embeddings: np.ndarray, threshold: float,
+                   candidates: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                   block_size: int = 1024) -> Dict[int, List[int]]:
     """
     Cluster items whose cosine similarity >= threshold.
     We transform similarity threshold to cosine distance radius: dist <= 1 - threshold.
+    If `candidates` (pair index arrays, e.g. from lsh_candidate_pairs) is given, only those pairs are scored.
     """
     n = embeddings.shape[0]
     if n == 0:
         return {}
 
-    # Normalize vectors for cosine similarity (optional but helps numerics)
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    norms[norms == 0.0] = 1.0
-    E = embeddings / norms
+    # OpenAI embeddings already come back unit-norm, so only divide when some row isn't;
+    # either way the similarity below is a plain dot product
+    norms = np.sqrt(np.einsum("ij,ij->i", embeddings, embeddings))[:, None]
+    if np.allclose(norms, 1.0, atol=1e-4):
+        E = embeddings
+    else:
+        norms[norms == 0.0] = 1.0
+        E = embeddings / norms
 
     radius = 1.0 - float(threshold)
     if radius <= 0 or radius >= 2:
         raise ValueError("Threshold must be between -1 and 1. Typical range: 0.85–0.97")
 
-    # Use NearestNeighbors with cosine metric to find neighbors within radius
-    nn = NearestNeighbors(metric="cosine", radius=radius, n_jobs=-1)
-    nn.fit(E)
-    # For each point, find neighbors within radius
-    # returns array of arrays of neighbor indices
-    neigh_ind = nn.radius_neighbors(E, radius=radius, return_distance=False)
+    # Cosine similarity of unit vectors is a dot product (GEMM tiles score every pair),
+    # and cosine distance <= radius is the same test as similarity >= threshold
+    if candidates is not None:
+        ci, cj = candidates
+        keep = np.einsum("ij,ij->i", E[ci], E[cj]) >= threshold
+        edges_i, edges_j = ci[keep], cj[keep]
+    elif faiss is not None:
+        edges_i, edges_j = _faiss_edges(E, threshold)
+    else:
+        edges_i, edges_j = _blocked_edges(E, threshold, block_size)
 
-    # Union-find over neighbor graph
-    dsu = DSU(n)
-    for i in range(n):
-        # connect i with all j in its epsilon-neighborhood
-        for j in neigh_ind[i]:
-            if i != j:
-                dsu.union(i, j)
+    # Union-find over neighbor graph (JIT-compiled when numba is installed)
+    labels = _dsu_labels(n, np.ascontiguousarray(edges_i, dtype=np.int64), np.ascontiguousarray(edges_j, dtype=np.int64))
 
     # Group by root
     clusters: Dict[int, List[int]] = {}
-    for i in range(n):
-        r = dsu.find(i)
+    for i, r in enumerate(labels.tolist()):
         clusters.setdefault(r, []).append(i)
 
     return clusters
 
-def choose_representative(indices: List[int], texts: List[str], strategy: str = "first") -> int:
+def choose_representative(indices: List[int], text_lens: np.ndarray, strategy: str = "first") -> int:
     """
     Pick one row to keep from a cluster.
+    `text_lens` holds the text length of every row, computed once by the caller.
     Strategies:
       - "first": keep first occurrence
-      - "longest": keep longest text
+      - "longest": keep longest text (earliest row on ties)
     """
     if strategy == "longest":
-        lengths = [(i, len(texts[i])) for i in indices]
-        lengths.sort(key=lambda x: x[1], reverse=True)
-        return lengths[0][0]
+        return indices[int(text_lens[indices].argmax())]
     return min(indices)  # first by original order
 
 # ---------------------------
@@ -183,6 +550,17 @@ def main():
     ap.add_argument("--threshold", type=float, default=0.92, help="Cosine similarity threshold (0.85–0.97 typical)")
     ap.add_argument("--model", default="text-embedding-3-small", help="Embedding model (e.g., text-embedding-3-small|large)")
     ap.add_argument("--batch-size", type=int, default=100, help="Embedding batch size")
+    ap.add_argument("--concurrency", type=int, default=8, help="Max embedding requests in flight")
+    ap.add_argument("--max-tpm", type=int, default=0, help="Optional tokens-per-minute budget for embedding calls (0 = unlimited)")
+    ap.add_argument("--backend", choices=["openai", "openai-batch"], default="openai",
+                    help="openai = interactive embeddings API; openai-batch = Batch API (50%% cheaper, up to 24h)")
+    ap.add_argument("--batch-dir", default=".dedupe_batch", help="Work dir for --backend openai-batch (request file + resumable state)")
+    ap.add_argument("--cache-db", default=None, help="Optional SQLite file caching embeddings across runs (keyed by model + text)")
+    ap.add_argument("--block-size", type=int, default=1024, help="Rows per side of each similarity tile (peak memory is one block-size x block-size tile)")
+    ap.add_argument("--lsh", action="store_true", help="Only score pairs proposed by MinHash/LSH on word 5-grams (needs datasketch)")
+    ap.add_argument("--lsh-threshold", type=float, default=0.3, help="Approximate Jaccard threshold for --lsh candidates")
+    ap.add_argument("--embeddings-mmap", default=None,
+                    help="Optional .npy path: keep embeddings in a disk-backed memmap (reused when the input is unchanged)")
     ap.add_argument("--rep-strategy", choices=["first", "longest"], default="first", help="Representative selection per cluster")
     args = ap.parse_args()
 
@@ -202,12 +580,8 @@ def main():
 
     # Pre-collapse exact duplicates (string-equal after normalization)
     print("Pre-collapsing exact duplicates...")
-    first_idx_by_text: Dict[str, int] = {}
-    group_indices: Dict[int, List[int]] = {}
-    for i, val in enumerate(df["_text_norm"].tolist()):
-        if val not in first_idx_by_text:
-            first_idx_by_text[val] = i
-        group_indices.setdefault(first_idx_by_text[val], []).append(i)
+    groups = df.groupby("_text_norm", sort=False).indices  # normalized text -> row positions (ascending)
+    group_indices: Dict[int, List[int]] = {int(v[0]): v.tolist() for v in groups.values()}
 
     # Representatives after exact-collapse
     exact_reps = sorted(group_indices.keys())
@@ -219,19 +593,32 @@ def main():
 
     # Embeddings for the representative set
     texts_rep = df_exact[args.text_col].astype(str).tolist()
-    embeddings = embed_texts(texts_rep, model=args.model, batch_size=args.batch_size)
+    cache = EmbeddingCache(args.cache_db) if args.cache_db else None
+    try:
+        embeddings = embed_texts(texts_rep, model=args.model, batch_size=args.batch_size, cache=cache,
+                                 concurrency=args.concurrency, max_tokens_per_minute=args.max_tpm,
+                                 backend=args.backend, batch_dir=args.batch_dir, mmap_path=args.embeddings_mmap)
+    finally:
+        if cache is not None:
+            cache.close()
 
     # Cluster near-duplicates on the representative set
-    clusters = build_clusters(embeddings, threshold=args.threshold)
+    candidates = None
+    if args.lsh:
+        candidates = lsh_candidate_pairs(df_exact["_text_norm"].tolist(), lsh_threshold=args.lsh_threshold)
+        print(f"LSH candidate pairs: {len(candidates[0])} (of {len(df_exact) * (len(df_exact) - 1) // 2})")
+    clusters = build_clusters(embeddings, threshold=args.threshold, candidates=candidates, block_size=args.block_size)
 
     # Map cluster root -> indices within df_exact
     # Choose representative per cluster (then map back to original df rows)
     kept_rows_exact_idx = []
     cluster_report: List[Tuple[int, List[int]]] = []
+    text_lens = df[args.text_col].astype(str).str.len().to_numpy()
+    orig_idx = df_exact["_orig_idx"].to_numpy()
 
     for root, members in clusters.items():
         # Convert local indices (within df_exact) to their original df indices
-        local_to_global = [int(df_exact.iloc[m]["_orig_idx"]) for m in members]
+        local_to_global = orig_idx[members].tolist()
         # From these, also gather any exact-duplicate fold-ins
         expanded = []
         for g in local_to_global:
@@ -239,7 +626,7 @@ def main():
         expanded = sorted(set(expanded))
 
         # Choose final representative
-        rep_global = choose_representative(expanded, df[args.text_col].astype(str).tolist(), strategy=args.rep_strategy)
+        rep_global = choose_representative(expanded, text_lens, strategy=args.rep_strategy)
         kept_rows_exact_idx.append(rep_global)
         cluster_report.append((rep_global, expanded))
 
@@ -253,17 +640,16 @@ def main():
     print(f"Wrote filtered (deduplicated) data: {args.out_path}  (rows: {len(df_filtered)})")
 
     if args.report_path:
-        # Expand report to a tidy format
-        rows = []
-        for rep, members in cluster_report:
-            for m in members:
-                rows.append({
-                    "kept_row_idx": rep,
-                    "member_row_idx": m,
-                    "kept_text": df.loc[rep, args.text_col],
-                    "member_text": df.loc[m, args.text_col]
-                })
-        rep_df = pd.DataFrame(rows)
+        # Expand report to a tidy format: one (kept, member) index pair per row, texts gathered in one take each
+        kept_idx = np.repeat([rep for rep, _ in cluster_report], [len(members) for _, members in cluster_report])
+        member_idx = np.fromiter((m for _, members in cluster_report for m in members), dtype=np.int64, count=len(kept_idx))
+        text_values = df[args.text_col].to_numpy()
+        rep_df = pd.DataFrame({
+            "kept_row_idx": kept_idx,
+            "member_row_idx": member_idx,
+            "kept_text": text_values[kept_idx],
+            "member_text": text_values[member_idx],
+        })
         save_df(rep_df, args.report_path)
         print(f"Wrote cluster report: {args.report_path}  (rows: {len(rep_df)})")
 